@@ -1,117 +1,135 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 import numpy as np
-from datetime import datetime
+from pathlib import Path
+from data_loader import load_data, kpi_summary, MISSING_CODE
 
 # 1. CONFIGURAÇÃO DA PÁGINA
 st.set_page_config(page_title="Fraud Sentinel Pro", layout="wide", page_icon="🛡️")
 
-# Estilização CSS personalizada
-st.markdown("""
-    <style>
-    .main { background-color: #05070a; }
-    div[data-testid="stMetricValue"] { color: #00f2ff; text-shadow: 0 0 10px rgba(0,242,255,0.2); }
-    .stMetric { background-color: #12141a; padding: 15px; border-radius: 10px; border: 1px solid #2d333b; }
-    </style>
-    """, unsafe_allow_html=True)
+# Estilização CSS personalizada (arquivo lido uma única vez por processo)
+@st.cache_resource
+def load_css(file_name):
+    return Path(file_name).read_text()
+
+st.markdown(f"<style>{load_css('assets/style.css')}</style>", unsafe_allow_html=True)
 
 # 2. CARREGAMENTO E TRATAMENTO DE DADOS
-@st.cache_data
-def load_data():
-    file_name = 'data.csv'
-    df = pd.read_csv(file_name)
-    
-    # Tratamento de Datas e Idade
-    df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'], dayfirst=True, errors='coerce')
-    df['hour'] = df['trans_date_trans_time'].dt.hour
-    df['dob'] = pd.to_datetime(df['dob'], dayfirst=True, errors='coerce')
-    df['age'] = (datetime.now() - df['dob']).dt.days // 365
-    
-    def haversine(lat1, lon1, lat2, lon2):
-        r = 6371 # km
-        phi1, phi2 = np.radians(lat1), np.radians(lat2)
-        dphi = np.radians(lat2 - lat1)
-        dlambda = np.radians(lon2 - lon1)
-        a = np.sin(dphi/2)**2 + np.cos(phi1)*np.cos(phi2)*np.sin(dlambda/2)**2
-        return 2 * r * np.arcsin(np.sqrt(a))
-
-    df['dist_km'] = haversine(df['lat'], df['long'], df['merch_lat'], df['merch_long'])
-    
-    # Estatística: Z-Score
-    df['avg_cat_amt'] = df.groupby('category')['amt'].transform('mean')
-    df['std_cat_amt'] = df.groupby('category')['amt'].transform('std')
-    df['z_score_amt'] = (df['amt'] - df['avg_cat_amt']) / (df['std_cat_amt'] + 1e-9)
-    df['is_value_anomaly'] = df['z_score_amt'] > 2
-    
-    dist_mean = df['dist_km'].mean()
-    dist_std = df['dist_km'].std()
-    df['is_dist_anomaly'] = df['dist_km'] > (dist_mean + 2 * dist_std)
-    
-    return df
-
-df = load_data()
+df, cat_codes = load_data('data.csv')
+category_options = df['category'].cat.categories.tolist()
 
 # 3. SIDEBAR
 st.sidebar.title("🛡️ Fraud Sentinel Pro")
 st.sidebar.markdown("---")
-categorias = st.sidebar.multiselect("Categories", df['category'].unique(), default=df['category'].unique())
+categorias = st.sidebar.multiselect("Categories", category_options, default=category_options)
 anomalias_apenas = st.sidebar.checkbox("Show Alerts Only")
 
-df_filtered = df[df['category'].isin(categorias)]
+# Uma única máscara booleana (categorias + alertas) e uma única cópia das linhas
+selected_codes = df['category'].cat.categories.get_indexer(categorias)
+mask = np.isin(cat_codes, selected_codes)
 if anomalias_apenas:
-    df_filtered = df_filtered[(df_filtered['is_value_anomaly']) | (df_filtered['is_dist_anomaly'])]
+    mask &= np.bitwise_or(df['is_value_anomaly'].values, df['is_dist_anomaly'].values)
+df_filtered = df.iloc[np.flatnonzero(mask)]
 
 # 4. CABEÇALHO
 st.title("Fraud Monitoring & Advanced Analytics")
 st.caption(f"US Market Analysis | Strategic Risk Intelligence | Developed by Alexandre C. Passos")
 
 # 5. KPIS (FORMATADOS EM DÓLAR)
+total_amt, fraud_share, avg_dist, n_value_anomalies, n_dist_anomalies = kpi_summary(
+    df_filtered['amt'].values, df_filtered['is_fraud'].values, df_filtered['dist_km'].values,
+    df_filtered['is_value_anomaly'].values, df_filtered['is_dist_anomaly'].values)
+
 m1, m2, m3, m4, m5 = st.columns(5)
 with m1:
-    st.metric("Total Volume", f"$ {df_filtered['amt'].sum():,.2f}")
+    st.metric("Total Volume", f"$ {total_amt:,.2f}")
 with m2:
-    fraud_rate = (df_filtered['is_fraud'].mean() * 100)
+    fraud_rate = (fraud_share * 100)
     st.metric("Fraud Rate", f"{fraud_rate:.2f}%", delta="-0.15%", delta_color="inverse")
 with m3:
-    st.metric("Avg Distance", f"{df_filtered['dist_km'].mean():.1f} km")
+    st.metric("Avg Distance", f"{avg_dist:.1f} km")
 with m4:
-    st.metric("Value Anomalies", int(df_filtered['is_value_anomaly'].sum()), delta="Z-Score > 2", delta_color="inverse")
+    st.metric("Value Anomalies", int(n_value_anomalies), delta="Z-Score > 2", delta_color="inverse")
 with m5:
-    st.metric("Geo Outliers", int(df_filtered['is_dist_anomaly'].sum()), delta="Above 2σ", delta_color="inverse")
+    st.metric("Geo Outliers", int(n_dist_anomalies), delta="Above 2σ (MAD)", delta_color="inverse")
 
 st.divider()
 
 # 6. VISUAIS PRINCIPAIS
+MAP_MAX_POINTS = 5000
+MAP_GRID_DEG = 0.5
+
+# Figuras em cache pela chave do filtro: o DataFrame (prefixo "_") não é hasheado
+# Categorias ordenadas: a mesma seleção em outra ordem reaproveita a figura; max_entries limita a memória
+FIG_CACHE_ENTRIES = 32
+filter_key = (tuple(sorted(categorias)), anomalias_apenas)
+
+@st.cache_data(max_entries=FIG_CACHE_ENTRIES)
+def make_map(_df_filtered, filter_key):
+    alerts_only = filter_key[1]
+    if alerts_only:
+        # Alertas: marcadores individuais, mantendo todas as fraudes e limitando as transações legítimas
+        is_fraud_row = _df_filtered['is_fraud'].values == 1
+        legit_df = _df_filtered[~is_fraud_row]
+        map_df = pd.concat([_df_filtered[is_fraud_row],
+                            legit_df.sample(min(MAP_MAX_POINTS, len(legit_df)), random_state=0)])
+        fig_map = px.scatter_mapbox(map_df, lat="lat", lon="long", color="is_fraud", 
+                                    size="amt", color_continuous_scale=["#00f2ff", "#ff3131"],
+                                    mapbox_style="carto-darkmatter", zoom=3, height=450)
+    else:
+        # Visão geral agregada no servidor: uma bolha por célula da grade (tamanho = nº de transações, cor = taxa de fraude)
+        grid_df = pd.DataFrame({
+            'lat': np.round(_df_filtered['lat'].values / MAP_GRID_DEG) * MAP_GRID_DEG,
+            'long': np.round(_df_filtered['long'].values / MAP_GRID_DEG) * MAP_GRID_DEG,
+            'is_fraud': _df_filtered['is_fraud'].values,
+        }).groupby(['lat', 'long'], as_index=False).agg(transactions=('is_fraud', 'size'), fraud_rate=('is_fraud', 'mean'))
+        fig_map = px.scatter_mapbox(grid_df, lat="lat", lon="long", color="fraud_rate",
+                                    size="transactions", color_continuous_scale=["#00f2ff", "#ff3131"],
+                                    labels={'fraud_rate': 'Fraud Rate', 'transactions': 'Transactions'},
+                                    mapbox_style="carto-darkmatter", zoom=3, height=450)
+    fig_map.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
+    return fig_map
+
+@st.cache_data(max_entries=FIG_CACHE_ENTRIES)
+def make_histogram(_df_filtered, filter_key):
+    # Contagens pré-calculadas com NumPy (bins comuns às duas classes): envia 2x25 inteiros em vez de N z-scores
+    # Z-Scores NaN (categoria com uma única transação, std indefinido) ficam de fora, como no px.histogram
+    finite = np.isfinite(_df_filtered['z_score_amt'].values)
+    z_score = _df_filtered['z_score_amt'].values[finite]
+    is_fraud_row = _df_filtered['is_fraud'].values[finite] == 1
+    edges = np.histogram_bin_edges(z_score, bins=25)
+    centers, widths = (edges[:-1] + edges[1:]) / 2, np.diff(edges)
+    fig_hist = go.Figure([go.Bar(x=centers, y=np.histogram(z_score[rows], bins=edges)[0], width=widths, marker_color=color)
+                          for rows, color in ((~is_fraud_row, "#00f2ff"), (is_fraud_row, "#ff3131"))])
+    fig_hist.update_layout(barmode='stack', bargap=0, xaxis_title="z_score_amt", yaxis_title="count",
+                           plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', showlegend=False, height=450)
+    return fig_hist
+
 col_map, col_stats = st.columns([2, 1])
 
 with col_map:
     st.subheader("📍 Geographical Risk Mapping")
-    fig_map = px.scatter_mapbox(df_filtered, lat="lat", lon="long", color="is_fraud", 
-                                size="amt", color_continuous_scale=["#00f2ff", "#ff3131"],
-                                mapbox_style="carto-darkmatter", zoom=3, height=450)
-    fig_map.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-    st.plotly_chart(fig_map, use_container_width=True)
+    st.plotly_chart(make_map(df_filtered, filter_key), use_container_width=True)
 
 with col_stats:
     st.subheader("📊 Z-Score Distribution")
-    fig_hist = px.histogram(df_filtered, x="z_score_amt", color="is_fraud",
-                            nbins=25, color_discrete_sequence=["#00f2ff", "#ff3131"])
-    fig_hist.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', showlegend=False, height=450)
-    st.plotly_chart(fig_hist, use_container_width=True)
+    st.plotly_chart(make_histogram(df_filtered, filter_key), use_container_width=True)
 
 # 7. MATRIZ DE RISCO (HEATMAP)
 st.divider()
 st.subheader("🕒 Risk Matrix: Hour of Day vs. Demographic Profile")
 
-bins = [0, 25, 40, 60, 100]
+# Faixas etárias codificadas em load_data a cada carga (age_group_code); rótulos só para o eixo
 labels = ['Youth (0-25)', 'Adult (26-40)', 'Senior (41-60)', 'Elderly (60+)']
-df_filtered['age_group'] = pd.cut(df_filtered['age'], bins=bins, labels=labels)
 
-heatmap_data = df_filtered.pivot_table(index='age_group', columns='hour', values='is_fraud', aggfunc='sum').fillna(0)
+# Linhas com data de transação ou de nascimento inválida (MISSING_CODE) ficam fora da matriz
+heatmap_rows = (df_filtered['hour'].values != MISSING_CODE) & (df_filtered['age_group_code'].values != MISSING_CODE)
+heatmap_data = df_filtered[heatmap_rows].groupby(['age_group_code', 'hour'])['is_fraud'].sum().unstack(fill_value=0)
 
 fig_heatmap = px.imshow(heatmap_data, labels=dict(x="Hour of Day", y="Profile", color="Frauds"),
-                        x=heatmap_data.columns, y=heatmap_data.index,
+                        x=heatmap_data.columns, y=[labels[code] for code in heatmap_data.index],
                         color_continuous_scale='Reds', aspect="auto")
 fig_heatmap.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color="white")
 st.plotly_chart(fig_heatmap, use_container_width=True)
@@ -119,8 +137,8 @@ st.plotly_chart(fig_heatmap, use_container_width=True)
 # 8. TABELA DE AUDITORIA (FORMATADA EM DÓLAR)
 st.divider()
 st.subheader("🕵️ Investigation Table (Top Alerts)")
-audit_df = df_filtered[['trans_date_trans_time', 'category', 'amt', 'dist_km', 'z_score_amt', 'is_fraud']]
-audit_df = audit_df.sort_values(by='z_score_amt', ascending=False).head(20)
+# df já vem ordenado por Z-Score decrescente (load_data), então basta o topo do filtro
+audit_df = df_filtered[['trans_date_trans_time', 'category', 'amt', 'dist_km', 'z_score_amt', 'is_fraud']].head(20)
 
 st.dataframe(
     audit_df,
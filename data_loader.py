@@ -0,0 +1,226 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import os
+import math
+import json
+import numba
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# TBB por último na ordem de camadas de threads do Numba: o Streamlit roda o script fora da thread principal
+# e, com TBB, kernels paralelos travam o interpretador no encerramento. Sem OpenMP instalado cai para
+# workqueue (embutida no Numba; segura aqui, os kernels paralelos só rodam a partir de uma thread, no load_data)
+numba.config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+# CARREGAMENTO E TRATAMENTO DE DADOS (compartilhado entre os dashboards)
+# Limites superiores (inclusivos) das faixas etárias
+AGE_BINS = np.array([25, 40, 60, 100])
+# Marcador para hora/idade de datas inválidas (NaT após errors='coerce'); fica fora do heatmap
+MISSING_CODE = -1
+# Versões do schema dos caches em disco: incrementar a cada mudança em read_raw / build_features
+# Os estágios invalidam em separado: mudar um limiar de anomalia (fixos em anomaly_scores) pede só
+# FEATURES_VERSION, e o data.parquet é refeito a partir do data.raw.parquet, sem reler o CSV
+RAW_VERSION = 1
+FEATURES_VERSION = 5
+CACHE_VERSION_KEY = b'fraud_sentinel.cache_version'
+# Chave em que o pandas guarda df.attrs no Parquet (restaurada por pd.read_parquet)
+ATTRS_KEY = b'PANDAS_ATTRS'
+# Únicas colunas do CSV usadas pelo dashboard
+USE_COLUMNS = ['trans_date_trans_time', 'category', 'amt', 'lat', 'long',
+               'merch_lat', 'merch_long', 'dob', 'is_fraud']
+
+@numba.vectorize(['float32(float32, float32, float32, float32)',
+                  'float64(float64, float64, float64, float64)'], target='parallel', fastmath=True)
+def haversine(lat1, lon1, lat2, lon2):
+    # Distância em km (2 * raio da Terra = 12742 km), em uma única passada distribuída entre os núcleos
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi * 0.5)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda * 0.5)**2
+    # Forma atan2 (estável perto de pontos antípodas); clamp de 'a' contra arredondamento com fastmath
+    a = min(a, 1.0)
+    return 12742.0 * math.atan2(math.sqrt(a), math.sqrt(1.0 - a))
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def anomaly_scores(amt, cat_codes, n_cats, dist):
+    # 1ª passada: média e variância por categoria (amt), via Welford
+    # amt NaN e categoria nula (código -1) ficam de fora, como no groupby do pandas
+    n = amt.size
+    cat_n = np.zeros(n_cats)
+    cat_mean = np.zeros(n_cats)
+    cat_m2 = np.zeros(n_cats)
+    for i in range(n):
+        g = cat_codes[i]
+        if g < 0 or np.isnan(amt[i]):
+            continue
+        cat_n[g] += 1
+        delta = amt[i] - cat_mean[g]
+        cat_mean[g] += delta / cat_n[g]
+        cat_m2[g] += delta * (amt[i] - cat_mean[g])
+    cat_std = np.sqrt(cat_m2 / (cat_n - 1))
+    # Limite robusto de distância: mediana + 2σ, com σ estimado pelo MAD (σ ≈ 1.4826 * MAD); NaN ignorado
+    dist_median = np.nanmedian(dist)
+    dist_mad = np.nanmedian(np.abs(dist - dist_median))
+    dist_limit = dist_median + 2 * 1.4826 * dist_mad
+
+    # 2ª passada (paralela): Z-Score e flags de anomalia de valor e distância
+    z_score = np.empty(n)
+    value_anomaly = np.empty(n, dtype=np.bool_)
+    dist_anomaly = np.empty(n, dtype=np.bool_)
+    for i in numba.prange(n):
+        g = cat_codes[i]
+        if g < 0:
+            # Sem categoria não há Z-Score (e -1 indexaria a última categoria)
+            z_score[i] = np.nan
+        else:
+            z_score[i] = (amt[i] - cat_mean[g]) / (cat_std[g] + 1e-9)
+        # Comparações com NaN dão False: amt ou distância ausentes não viram alerta
+        value_anomaly[i] = z_score[i] > 2
+        dist_anomaly[i] = dist[i] > dist_limit
+    return z_score, value_anomaly, dist_anomaly, dist_median, dist_mad
+
+@numba.njit(cache=True)
+def kpi_summary(amt, is_fraud, dist, value_anomaly, dist_anomaly):
+    # Os cinco KPIs do painel em uma única passada (acumuladores em float64)
+    # amt/distância NaN ficam fora da soma e da média, como em Series.sum()/mean()
+    total_amt, n_fraud, total_dist, n_dist_valid = 0.0, 0, 0.0, 0
+    n_value, n_dist = 0, 0
+    for i in range(amt.size):
+        if not np.isnan(amt[i]):
+            total_amt += amt[i]
+        n_fraud += is_fraud[i]
+        if not np.isnan(dist[i]):
+            total_dist += dist[i]
+            n_dist_valid += 1
+        n_value += value_anomaly[i]
+        n_dist += dist_anomaly[i]
+    n = amt.size
+    fraud_share = n_fraud / n if n > 0 else np.nan
+    avg_dist = total_dist / n_dist_valid if n_dist_valid > 0 else np.nan
+    return total_amt, fraud_share, avg_dist, n_value, n_dist
+
+def write_cache(df, cache_file, version):
+    # Parquet com a versão do schema (e df.attrs, como faz o df.to_parquet) gravados nos metadados do arquivo
+    table = pa.Table.from_pandas(df)
+    metadata = {**table.schema.metadata, CACHE_VERSION_KEY: str(version).encode()}
+    if df.attrs:
+        metadata[ATTRS_KEY] = json.dumps(df.attrs).encode()
+    table = table.replace_schema_metadata(metadata)
+    # Grava em arquivo temporário no mesmo diretório e troca atomicamente: uma escrita interrompida
+    # nunca deixa um Parquet truncado (e com mtime novo) no lugar do cache
+    tmp_file = cache_file.with_name(f'{cache_file.name}.{os.getpid()}.tmp')
+    try:
+        pq.write_table(table, tmp_file, compression='zstd')
+        os.replace(tmp_file, cache_file)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+
+def cache_version(cache_file):
+    # Lê só o schema do Parquet; arquivos sem a chave (versões antigas) ou ilegíveis devolvem None
+    try:
+        version = (pq.read_schema(cache_file).metadata or {}).get(CACHE_VERSION_KEY)
+    except (pa.ArrowInvalid, OSError):
+        return None
+    return int(version) if version is not None else None
+
+def cache_is_fresh(cache_file, file_name, version):
+    # Cache em disco só vale se for mais novo que o CSV de origem e tiver a versão de schema esperada
+    return (cache_file.exists() and cache_file.stat().st_mtime >= Path(file_name).stat().st_mtime
+            and cache_version(cache_file) == version)
+
+def read_raw(file_name):
+    # Cópia binária do CSV (tipos e datas já convertidos): parse de texto só na primeira execução
+    # Sem cache em memória: só é chamada dentro de load_data (cache_resource), e o estágio bruto
+    # já é invalidado à parte em disco (RAW_VERSION / data.raw.parquet)
+    raw_file = Path(file_name).with_suffix('.raw.parquet')
+    if cache_is_fresh(raw_file, file_name, RAW_VERSION):
+        return pd.read_parquet(raw_file)
+
+    # Leitura multi-thread com o parser CSV do PyArrow
+    # Coordenadas e valores em float32: precisão suficiente com metade da memória
+    float_cols = ['lat', 'long', 'merch_lat', 'merch_long', 'amt']
+    column_types = {col: pa.float32() for col in float_cols}
+    # category como dicionário (vira Categorical): groupby e filtros operam sobre códigos inteiros
+    column_types['category'] = pa.dictionary(pa.int32(), pa.string())
+    # Rótulo 0/1 em um byte por linha (int8: o plotly só trata kinds 'i'/'f' como cor contínua)
+    column_types['is_fraud'] = pa.int8()
+    # Projeção já na leitura: as demais colunas nem chegam a ser convertidas
+    table = pacsv.read_csv(file_name, convert_options=pacsv.ConvertOptions(column_types=column_types,
+                                                                            include_columns=USE_COLUMNS))
+    df = table.to_pandas()
+    
+    # Formato fixo do arquivo (DD-MM-AAAA), evitando a inferência linha a linha
+    df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'], format='%d-%m-%Y %H:%M', errors='coerce', cache=True)
+    df['dob'] = pd.to_datetime(df['dob'], format='%d-%m-%Y', errors='coerce', cache=True)
+
+    write_cache(df, raw_file, RAW_VERSION)
+    return df
+
+def date_features(df):
+    # Hora do dia direto dos segundos desde a época (sem o acessor .dt); NaT vira MISSING_CODE
+    ts_s = df['trans_date_trans_time'].values.astype('datetime64[s]').view(np.int64)
+    hour = np.where(df['trans_date_trans_time'].isna().values, MISSING_CODE, (ts_s // 3600) % 24).astype('int8')
+    return {'hour': hour}
+
+def age_features(df):
+    # Depende da data atual: calculada a cada carga e nunca gravada no Parquet (ficaria velha a cada aniversário)
+    # Idade exata em anos só com aritmética inteira sobre ano/mês/dia (desconta se o aniversário ainda não chegou)
+    # dob NaT vira MISSING_CODE em idade e faixa etária (NaN não cabe em int16/int8)
+    today = datetime.now()
+    dob_missing = df['dob'].isna().values
+    dob = df['dob'].dt
+    month, day = dob.month.fillna(0).values, dob.day.fillna(0).values
+    birthday_pending = (month > today.month) | ((month == today.month) & (day > today.day))
+    age = np.where(dob_missing, MISSING_CODE, today.year - dob.year.fillna(today.year).values - birthday_pending).astype('int16')
+    # Faixa etária (0-25, 26-40, 41-60, 60+) como código int8, via busca binária nos limites superiores
+    age_group_code = np.where(dob_missing, MISSING_CODE,
+                              np.searchsorted(AGE_BINS, age).clip(0, len(AGE_BINS) - 1)).astype('int8')
+    return {'age': age, 'age_group_code': age_group_code}
+
+def risk_features(df):
+    dist_km = haversine(df['lat'].values, df['long'].values,
+                        df['merch_lat'].values, df['merch_long'].values)
+    # Estatística: Z-Score e anomalias de distância (flags como np.bool_ puro, sem BooleanDtype anulável)
+    z_score, value_anomaly, dist_anomaly, dist_median, dist_mad = anomaly_scores(
+        df['amt'].values, df['category'].cat.codes.values, len(df['category'].cat.categories), dist_km)
+    columns = {'dist_km': dist_km, 'z_score_amt': z_score,
+               'is_value_anomaly': value_anomaly, 'is_dist_anomaly': dist_anomaly}
+    # Mediana/MAD da distância como escalares: outro corte em σ sai deles sem reler dist_km
+    return columns, {'dist_median': float(dist_median), 'dist_mad': float(dist_mad)}
+
+def build_features(file_name):
+    df = read_raw(file_name)
+
+    # Blocos independentes (hora e distância/Z-Score) em paralelo: os kernels NumPy/Numba liberam o GIL
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        dates = pool.submit(date_features, df)
+        risk = pool.submit(risk_features, df)
+        risk_columns, dist_stats = risk.result()
+        for name, values in {**dates.result(), **risk_columns}.items():
+            df[name] = values
+    df.attrs.update(dist_stats)
+    
+    # Ordenado por Z-Score decrescente uma única vez: qualquer filtro preserva a ordem da auditoria
+    return df.sort_values('z_score_amt', ascending=False, kind='stable')
+
+# cache_resource: o DataFrame (somente leitura no app) é devolvido por referência, sem cópia/pickle a cada rerun
+@st.cache_resource
+def load_data(file_name):
+    cache_file = Path(file_name).with_suffix('.parquet')
+    # Cache em disco do DataFrame já processado (evita reprocessar o CSV)
+    if cache_is_fresh(cache_file, file_name, FEATURES_VERSION):
+        df = pd.read_parquet(cache_file)
+    else:
+        df = build_features(file_name)
+        write_cache(df, cache_file, FEATURES_VERSION)
+    for name, values in age_features(df).items():
+        df[name] = values
+
+    # Códigos inteiros da categoria, para filtrar sem comparar strings a cada rerun
+    cat_codes = df['category'].cat.codes.values
+    return df, cat_codes